@@ -0,0 +1,36 @@
+import math
+
+import cv2
+import numpy as np
+
+
+def bgra_to_bgr(bgra, bgr):
+	"""Drop the alpha channel of bgra into the preallocated (h, w, 3) buffer bgr."""
+	# only a byte shuffle, no colour math; cvtColor's SIMD BGRA2BGR path is ~3x
+	# faster than the equivalent cv2.mixChannels, so don't swap it for that
+	cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=bgr)
+
+
+def aligned_empty(shape, align=32):
+	"""
+	Uninitialised C-contiguous uint8 array whose data starts on an align-byte
+	boundary, so OpenCV and the writers take their aligned SIMD copy paths.
+	"""
+	size = math.prod(shape)
+	raw = np.empty(size + align, dtype=np.uint8)
+	offset = -raw.ctypes.data % align
+	return raw[offset:offset + size].reshape(shape)
+
+
+def i420_shape(width, height):
+	"""Shape of a single buffer holding the Y plane followed by the U and V planes."""
+	return (height * 3 // 2, width)
+
+
+def bgra_to_i420(bgra, i420):
+	"""
+	Convert bgra (h, w, 4) to planar 4:2:0 YUV in the preallocated
+	i420_shape(w, h) buffer; h and w must be even. The encoders take this
+	as-is, so ffmpeg does no colour conversion of its own.
+	"""
+	cv2.cvtColor(bgra, cv2.COLOR_BGRA2YUV_I420, dst=i420)
@@ -1,30 +1,39 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+from dataclasses import dataclass, field
 import datetime
 from mss import mss
 import numpy as np
+import queue
 from PyQt5 import QtWidgets, QtCore, QtGui
 import sys
 import time
 import threading
 
+from colorconvert import aligned_empty, bgra_to_bgr, bgra_to_i420, i420_shape
 from update_files import update_file_names
+from videowriter import ffmpeg_encoder, open_video_writer
 
 SYSTEM_OS        = sys.platform
 CAPTURE_FPS      = 60
 CAPTURE_INTERVAL = 1.0 / CAPTURE_FPS
 EXPECTED_WIDTH = 464
 EXPECTED_HEIGHT = 838
+MAX_WINDOWS      = 10
+ENUM_INTERVAL    = 0.2  # seconds between window re-enumerations
+RESIZE_INTERVAL  = 1.0  # seconds between checks for windows needing a resize
+RING_SIZE        = 3    # converted frames per window, shared with its encoder thread
+ENCODER_POLL_INTERVAL = 0.1  # seconds between encoder liveness checks while the ring is full
+UNION_MAX_AREA_RATIO = 2.0  # grab one bounding box while it is at most this much larger than the windows
 
 if SYSTEM_OS == 'darwin':
-	from windowcapture import WindowCapture
+	from windowcapture import WindowCapture, WindowNotFound
 elif SYSTEM_OS == 'win32':
 	try:
-		import pygetwindow as gw
 		import win32gui
 		import win32con
 	except ImportError:
-		gw = None  # fallback to per-OS logic
 		raise RuntimeError("windows packages not available; please install")
 else:
 	raise RuntimeError("Unsupported OS. This script only supports macOS (darwin) and Windows (win32).")
@@ -34,8 +43,11 @@ class OverlayWindow(QtWidgets.QWidget):
 		super().__init__(flags=QtCore.Qt.FramelessWindowHint | QtCore.Qt.WindowStaysOnTopHint)
 		self.setAttribute(QtCore.Qt.WA_TranslucentBackground)
 		self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents, True)
-		self.regions = []
+		self.regions = []  # (region, label) pairs
+		self._region_keys = ()
 		self.stop_event = stop_event
+		self._pen  = QtGui.QPen(QtGui.QColor(0, 200, 0, 180), 3)
+		self._font = QtGui.QFont("Arial", 10)
 
 		# Cover all monitors
 		geom = QtWidgets.QApplication.primaryScreen().geometry()
@@ -45,23 +57,29 @@ class OverlayWindow(QtWidgets.QWidget):
 		self.show()
 
 	def update_regions(self, regions):
-		self.regions = regions
+		keys = tuple((r['left'], r['top'], r['width'], r['height']) for r in regions)
 		# only repaint if regions changed
-		self.update()
+		if keys == self._region_keys:
+			return
+		# repaint just the area covered by rects that appeared or disappeared
+		dirty = QtCore.QRect()
+		for left, top, width, height in set(keys).symmetric_difference(self._region_keys):
+			# pad for the pen width
+			dirty = dirty.united(QtCore.QRect(left, top, width, height).adjusted(-3, -3, 3, 3))
+		self._region_keys = keys
+		# text inside each rectangle showing left, top, width values; published with
+		# its region in a single assignment, since paintEvent reads it on the GUI thread
+		self.regions = [(r, f"({r['left']}, {r['top']}, {r['width']})") for r in regions]
+		self.update(dirty)
 
 	def paintEvent(self, e):
 		painter = QtGui.QPainter(self)
-		pen = QtGui.QPen(QtGui.QColor(0, 200, 0, 180), 3)
-		painter.setPen(pen)
-		for r in self.regions:
+		painter.setPen(self._pen)
+		painter.setFont(self._font)
+		for r, label in self.regions:
 			painter.drawRect(r['left'], r['top'], r['width'], r['height'])
-			
-			# Add text inside the rectangle showing left, top, width values
-			text = f"({r['left']}, {r['top']}, {r['width']})"
-			font = QtGui.QFont("Arial", 10)
-			painter.setFont(font)
 			# painter.setPen(QtGui.QColor(255, 255, 255))  # White text
-			painter.drawText(r['left'] + 5, r['top'] + 20, text)  # Offset for padding
+			painter.drawText(r['left'] + 5, r['top'] + 20, label)  # Offset for padding
 
 	def closeEvent(self, event):
 		print("Closing overlay window...")
@@ -69,60 +87,22 @@ class OverlayWindow(QtWidgets.QWidget):
 		self.stop_event.set()
 		event.accept()
 
-def append_window(rects, w):
-	if any(r['left'] == w.left and r['top'] == w.top for r in rects):
-		return
-	# skip left edge windows
-	if w.left <= 1 or w.top <= 1:
-		return
-	rects.append({
-		'left':   w.left,
-		'top':    w.top,
-		'width':  w.width,
-		'height': w.height
-	})
-
-
-def list_window_positions():
+def append_window(rects, seen, w):
 	"""
-	Enumerate all visible, titled top-level windows.
-	Returns a list of dicts with keys:
-		- hwnd  : window handle
-		- title : window title
-		- left, top, width, height
+	Append window dict w (hwnd, left, top, width, height) to rects
+	unless a window at the same (left, top) is already in seen.
 	"""
-	windows = []
-
-	def _enum(hwnd, _):
-		if win32gui.IsWindowVisible(hwnd):
-			title = win32gui.GetWindowText(hwnd).strip()
-			if title:
-				left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-				windows.append({
-					'hwnd':   hwnd,
-					'title':  title,
-					'left':   left,
-					'top':    top,
-					'width':  right - left,
-					'height': bottom - top
-				})
-
-	win32gui.EnumWindows(_enum, None)
-	return windows
-
-def resize_window(title, x, y, width, height):
-	selected_window = None
-	windows = list_window_positions()
-	for w in windows:
-		if title in w['title'] and w['left'] == x and w['top'] == y:
-			selected_window = w
-			break
-	if not selected_window:
-		raise ValueError(f"Window with title '{title}' not found")
-	print(f"Resizing window '{selected_window['title']}' to {width}x{height} at ({x}, {y})")
-	selected_hwnd = selected_window['hwnd']
+	key = (w['left'], w['top'])
+	# skip duplicates and left edge windows
+	if key in seen or w['left'] <= 1 or w['top'] <= 1:
+		return
+	seen.add(key)
+	rects.append(w)
+
+def resize_window(hwnd, x, y, width, height):
+	print(f"Resizing window {hwnd} to {width}x{height} at ({x}, {y})")
 	win32gui.SetWindowPos(
-		selected_hwnd, None,
+		hwnd, None,
 		x, y, width, height,
 		win32con.SWP_NOZORDER | win32con.SWP_SHOWWINDOW
 	)
@@ -130,64 +110,295 @@ def resize_window(title, x, y, width, height):
 def find_windows(title):
 	"""Return list of dicts with left, top, width, height for each live window."""
 	rects = []
+	seen  = set()
 	if SYSTEM_OS == 'win32':
-		for w in gw.getWindowsWithTitle(title):
-			if not w.visible or w.isMinimized:
-				continue
-			append_window(rects, w)
-		for rect in rects:
-			if rect['width'] != EXPECTED_WIDTH or rect['height'] != EXPECTED_HEIGHT:
-				print(f"Resizing window {title} from {rect['width']}x{rect['height']} to {EXPECTED_WIDTH}x{EXPECTED_HEIGHT}")
-				resize_window(title, rect['left'], rect['top'], EXPECTED_WIDTH, EXPECTED_HEIGHT)
-				time.sleep(0.25)  # give it a moment to resize
+		# case-insensitive, like the pygetwindow lookup this replaced
+		needle = title.lower()
+		# single EnumWindows pass: filter, measure and dedup in the callback
+		def _enum(hwnd, _):
+			if not win32gui.IsWindowVisible(hwnd) or win32gui.IsIconic(hwnd):
+				return
+			if needle not in win32gui.GetWindowText(hwnd).lower():
+				return
+			left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+			append_window(rects, seen, {
+				'hwnd':   hwnd,
+				'left':   left,
+				'top':    top,
+				'width':  right - left,
+				'height': bottom - top
+			})
+
+		win32gui.EnumWindows(_enum, None)
 
 	elif SYSTEM_OS == 'darwin':
-		wc = WindowCapture(title)
-		if wc.window is not None:
-			w = wc.window
-			if not w.isMinimized:
-				append_window(rects, w)
+		try:
+			wc = WindowCapture(title)
+		except WindowNotFound:
+			return rects  # not open (yet, or any more): zero windows, not an error
+		if wc.window is not None and wc.window.get('kCGWindowIsOnscreen'):
+			append_window(rects, seen, {
+				'hwnd':   wc.window_id,
+				'left':   wc.window_x,
+				'top':    wc.window_y,
+				'width':  wc.window_width,
+				'height': wc.window_height
+			})
 	#order the rects to prevent flickering between windows
 	rects.sort(key=lambda r: (r['top'], r['left']))
 	return rects
 
+class WindowMonitor:
+	"""
+	Enumerates target windows on its own thread so Win32 calls stay out of
+	the capture loop's frame budget. The latest result is published by
+	reassigning self.rects, which readers pick up without locking.
+	"""
+
+	def __init__(self, title, stop_event):
+		self.title = title
+		self.stop_event = stop_event
+		self.rects = []
+		self.thread = threading.Thread(target=self._run, daemon=True)
+
+	def start(self):
+		self.thread.start()
+
+	def _run(self):
+		last_resize_t = float('-inf')
+		while not self.stop_event.is_set():
+			# a window can close mid-enumeration (WindowCapture / GetWindowRect raise);
+			# log it and try again next round rather than letting the thread die silently
+			try:
+				rects = find_windows(self.title)
+			except Exception as e:
+				print(f"Window enumeration failed: {e!r}")
+				self.stop_event.wait(ENUM_INTERVAL)
+				continue
+			self.rects = rects
+			# resizing fights the user if done too eagerly, so check it at a slower cadence
+			if SYSTEM_OS == 'win32' and time.monotonic() - last_resize_t > RESIZE_INTERVAL:
+				last_resize_t = time.monotonic()
+				for rect in rects:
+					if rect['width'] != EXPECTED_WIDTH or rect['height'] != EXPECTED_HEIGHT:
+						print(f"Resizing window {self.title} from {rect['width']}x{rect['height']} to {EXPECTED_WIDTH}x{EXPECTED_HEIGHT}")
+						try:
+							resize_window(rect['hwnd'], rect['left'], rect['top'], EXPECTED_WIDTH, EXPECTED_HEIGHT)
+						except Exception as e:
+							# e.g. SetWindowPos is denied on elevated windows
+							print(f"Resizing window {rect['hwnd']} failed: {e!r}")
+			self.stop_event.wait(ENUM_INTERVAL)
+
+_thread_state = threading.local()
+
+def thread_sct():
+	"""Return the calling thread's own mss instance; mss handles must not be shared across threads."""
+	sct = getattr(_thread_state, 'sct', None)
+	if sct is None:
+		sct = _thread_state.sct = mss()
+	return sct
+
+@dataclass(slots=True)
+class Stream:
+	"""VideoWriter, frame ring and grab region for one captured window."""
+	index: int
+	rect: dict
+	video_writer: object
+	shape: tuple       # expected (h, w, 4) of each grabbed BGRA frame
+	convert: object    # bgra_to_bgr or bgra_to_i420
+	ring: list         # RING_SIZE converted frames, reused round-robin
+	idx: int = 0
+	pending: queue.Queue = field(init=False)
+	encoder: threading.Thread = field(init=False)
+	error: Exception = field(init=False, default=None)  # set if the encoder thread failed
+
+	def __post_init__(self):
+		# one slot being encoded + one queued + one being filled: the producer
+		# blocks on put() before it can wrap onto a buffer still in use
+		self.pending = queue.Queue(maxsize=RING_SIZE - 2)
+		self.encoder = threading.Thread(target=self._encode, daemon=True)
+		self.encoder.start()
+
+	def _encode(self):
+		try:
+			while (out := self.pending.get()) is not None:
+				self.video_writer.write(out)
+		except Exception as e:
+			# e.g. BrokenPipeError once ffmpeg exits; surfaced to the producer
+			self.error = e
+
+	def _raise_encoder_error(self):
+		if self.error is not None:
+			raise RuntimeError(f"Encoder for window {self.index} failed") from self.error
+
+	def _put(self, item):
+		# poll so a dead encoder can't leave the producer blocked on a full queue
+		while True:
+			try:
+				self.pending.put(item, timeout=ENCODER_POLL_INTERVAL)
+				return
+			except queue.Full:
+				if not self.encoder.is_alive():
+					self._raise_encoder_error()
+					raise RuntimeError(f"Encoder for window {self.index} stopped")
+
+	def capture(self):
+		# grab the region and wrap the raw BGRA bytes without copying
+		shot = thread_sct().grab(self.rect)
+		self.write_frame(np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4))
+
+	def write_frame(self, frame):
+		self._raise_encoder_error()
+		if frame.shape != self.shape:
+			return  # window resized since the last enumeration; the next one reopens the writer
+		# MSS gives BGRA; convert straight into the next ring slot and hand it to the encoder
+		out = self.ring[self.idx % RING_SIZE]
+		self.convert(frame, out)
+		self._put(out)
+		self.idx += 1
+
+	def release(self):
+		try:
+			if self.encoder.is_alive():
+				self._put(None)
+				self.encoder.join()
+			self.video_writer.release()
+		finally:
+			self._raise_encoder_error()
+		print("Recording finished and file closed.")
+
+def _ensure_writer(streams, i, r, output_prefix):
+	"""Point streams[i] at r, opening a new writer only if the window is new or changed size."""
+	w, h = r['width'], r['height']
+	if i < len(streams):
+		stream = streams[i]
+		if stream.rect['width'] == w and stream.rect['height'] == h:
+			# same size: move the pinned grab region in place
+			stream.rect['left'] = r['left']
+			stream.rect['top']  = r['top']
+			return
+		# size changed: finish the old file rather than writing mismatched frames into it
+		stream.release()
+
+	# millisecond resolution: a stream reopened after a resize must not overwrite
+	# the file it just finalised in the same second
+	timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+	filename  = f"{output_prefix}capture_{i}_{timestamp}.mp4"
+	#handle macOS retina display scaling
+	if SYSTEM_OS == 'darwin':
+		w = int(w * 2)
+		h = int(h * 2)
+	# hand ffmpeg the encoders' native 4:2:0 input, converted in one cvtColor pass
+	if ffmpeg_encoder() is not None and w % 2 == 0 and h % 2 == 0:
+		writer = open_video_writer(filename, CAPTURE_FPS, (w, h), 'yuv420p')
+		convert, out_shape = bgra_to_i420, i420_shape(w, h)
+	else:
+		writer = open_video_writer(filename, CAPTURE_FPS, (w, h))
+		convert, out_shape = bgra_to_bgr, (h, w, 3)
+	stream = Stream(
+		index=i,
+		rect={'left': r['left'], 'top': r['top'], 'width': r['width'], 'height': r['height']},
+		video_writer=writer,
+		shape=(h, w, 4),
+		convert=convert,
+		ring=[aligned_empty(out_shape) for _ in range(RING_SIZE)]
+	)
+	print(f"Recording to {output_prefix}{filename} @ {CAPTURE_FPS} FPS...")
+	if i < len(streams):
+		streams[i] = stream
+	else:
+		streams.append(stream)
+
+def union_rect(rects):
+	"""
+	Return the bounding box of rects as an mss grab region, or None when it would
+	cover far more than the windows themselves (e.g. windows on different monitors).
+	"""
+	left   = min(r['left'] for r in rects)
+	top    = min(r['top'] for r in rects)
+	width  = max(r['left'] + r['width'] for r in rects) - left
+	height = max(r['top'] + r['height'] for r in rects) - top
+	if width * height > UNION_MAX_AREA_RATIO * sum(r['width'] * r['height'] for r in rects):
+		return None
+	return {'left': left, 'top': top, 'width': width, 'height': height}
+
+def union_crops(rects, union, scale):
+	"""Index tuples cutting each rect out of a grab of union taken at the given pixel scale."""
+	crops = []
+	for r in rects:
+		y = (r['top'] - union['top']) * scale
+		x = (r['left'] - union['left']) * scale
+		crops.append((slice(y, y + r['height'] * scale), slice(x, x + r['width'] * scale)))
+	return crops
+
 def capture_loop(overlay: OverlayWindow, stop_event: threading.Event, target_title: str, output_prefix: str):
-	sct = mss()
-	video_writers = [None] * 10  # preallocate for 10 windows
-	while not stop_event.is_set():
-		rects = find_windows(target_title)
-		overlay.update_regions(rects)
-		if rects:
-			for i, r in enumerate(rects):
-				w, h = r['width'], r['height']
-				rect = {'left': r['left'], 'top': r['top'], 'width': w, 'height': h}
-				# lazily initialize VideoWriter once we know size
-				if video_writers[i] is None:
-					# print("rect:", union_rect)
-					fourcc   = cv2.VideoWriter_fourcc(*'mp4v')
-					timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-					filename  = f"{output_prefix}capture_{i}_{timestamp}.mp4"
-					#handle macOS retina display scaling
-					if SYSTEM_OS == 'darwin':
-						w = int(w * 2)
-						h = int(h * 2)
-					video_writers[i] = cv2.VideoWriter(
-						filename, fourcc, CAPTURE_FPS, (w, h)
-					)
-					print(f"Recording to {output_prefix}{filename} @ {CAPTURE_FPS} FPS...")
-				# grab the region
-				frame = np.array(sct.grab(rect))
-				# MSS gives BGRA; drop alpha and convert to BGR
-				bgr   = cv2.cvtColor(frame[..., :3], cv2.COLOR_RGB2BGR)
-				video_writers[i].write(bgr)
-		time.sleep(CAPTURE_INTERVAL)
-
-	print("Stopping capture...")
-	for video_writer in video_writers:
-		if video_writer is not None:
-			video_writer.release()
-			print("Recording finished and file closed.")
-	update_file_names(output_prefix)
+	# a single window's convert is too small to amortise OpenCV's internal threading,
+	# and the pool below already parallelises across windows
+	cv2.setNumThreads(1)
+	cv2.ocl.setUseOpenCL(False)
+	streams = []
+	active  = []
+	# grab/convert/encode all release the GIL, so windows are captured in parallel
+	pool = ThreadPoolExecutor(max_workers=MAX_WINDOWS)
+	# pace against absolute deadlines so slow ticks don't accumulate drift
+	t0 = time.monotonic()
+	frame_idx = 0
+	rects = []
+	union = None  # shared grab region for all windows, when they sit close together
+	crops = None  # per-window views into the union grab
+	published = None
+	monitor = WindowMonitor(target_title, stop_event)
+	monitor.start()
+	errors = []
+	try:
+		while not stop_event.is_set():
+			# the monitor publishes a new list on every enumeration; only then compare contents
+			if monitor.rects is not published:
+				published = monitor.rects
+				new_rects = published[:MAX_WINDOWS]
+				if new_rects != rects:
+					rects = new_rects
+					for i, r in enumerate(rects):
+						_ensure_writer(streams, i, r, output_prefix)
+					active = streams[:len(rects)]
+					union = union_rect(rects) if rects else None
+					crops = None
+					overlay.update_regions(rects)
+			if active and union is not None:
+				# one grab for all windows, then convert/encode each cropped view in parallel
+				shot = thread_sct().grab(union)
+				full = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+				if crops is None:
+					# shot is in physical pixels, e.g. 2x the rects on Retina displays
+					crops = union_crops(rects, union, shot.width // union['width'])
+				list(pool.map(Stream.write_frame, active, [full[c] for c in crops]))
+			elif active:
+				# wait for every window before the next tick; list() also re-raises worker errors
+				list(pool.map(Stream.capture, active))
+			frame_idx += 1
+			delay = t0 + frame_idx * CAPTURE_INTERVAL - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+			elif delay < -CAPTURE_INTERVAL:
+				# stalled (writer setup/teardown, encoder probe): drop the missed ticks and
+				# rebase, since catching up back-to-back would play back sped up
+				t0 = time.monotonic()
+				frame_idx = 0
+	finally:
+		# runs on a normal stop and when a capture error escapes the loop, so
+		# every writer / ffmpeg pipe is still finalised
+		print("Stopping capture...")
+		stop_event.set()
+		pool.shutdown()
+		for stream in streams:
+			try:
+				stream.release()
+			except Exception as e:
+				print(f"Failed to finalise recording for window {stream.index}: {e!r}")
+				errors.append(e)
+		update_file_names(output_prefix)
+	if errors:
+		raise errors[0]
 
 if __name__ == "__main__":
 	parser = argparse.ArgumentParser(description="Screen capture application.")
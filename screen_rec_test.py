@@ -3,6 +3,8 @@ import numpy as np
 import cv2
 import time
 
+from colorconvert import aligned_empty, bgra_to_bgr
+
 CAPTURE_FPS = 20.0
 CAPTURE_INTERVAL = 1.0 / CAPTURE_FPS
 
@@ -10,6 +12,7 @@ def capture_loop():
 	sct = mss()
 	video_writer = None
 	union_rect = None
+	bgr_buf = None  # allocated once from the first grab's size
 	# while not stop_event.is_set():
 	i = 0
 	left, top     = 50, 50
@@ -31,14 +34,17 @@ def capture_loop():
 			)
 			print(f"Recording to {filename} @ {CAPTURE_FPS} FPS...")
 
-		# grab the union region
-		frame = np.array(sct.grab(union_rect))
-		if i == 0:
-			cv2.imwrite("first_frame.png", frame[..., :3])
+		# grab the union region and wrap the raw BGRA bytes without copying
+		shot = sct.grab(union_rect)
+		bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+		if bgr_buf is None:
+			bgr_buf = aligned_empty((shot.height, shot.width, 3))
 
-		# MSS gives BGRA; drop alpha and convert to BGR
-		bgr = cv2.cvtColor(frame[..., :3], cv2.COLOR_RGB2BGR)
-		video_writer.write(bgr)
+		# MSS gives BGRA; drop alpha straight into the reused buffer
+		bgra_to_bgr(bgra, bgr_buf)
+		if i == 0:
+			cv2.imwrite("first_frame.png", bgr_buf)
+		video_writer.write(bgr_buf)
 
 		time.sleep(CAPTURE_INTERVAL)
 		i += 1
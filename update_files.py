@@ -1,14 +1,17 @@
 import os
+import re
+
+# matches the "<size>MB_" prefix this module adds, so re-runs don't rename twice
+SIZE_PREFIX = re.compile(r'^\d+(\.\d+)?MB_')
 
 def update_file_names(output: str):
-	files = os.listdir(output)
-	for i, file_name in enumerate(files):
-		if file_name.endswith('.mp4'):
-			# print(f"Renaming file: {file_name} {i+1}/{len(files)}")
-			file_path = os.path.join(output, file_name)
-			size = os.path.getsize(file_path)
-			size_mb = size / (1024 * 1024)
-			size_str = f'{size_mb:.1f}MB'
-			new_file_name = f"{size_str}_{file_name}"
-			new_file_path = os.path.join(output, new_file_name)
-			os.rename(file_path, new_file_path)
\ No newline at end of file
+	# scandir yields entries whose stat is cached from the directory read
+	with os.scandir(output or '.') as entries:
+		for entry in entries:
+			if entry.name.endswith('.mp4') and not SIZE_PREFIX.match(entry.name):
+				# print(f"Renaming file: {entry.name}")
+				size_mb = entry.stat().st_size / (1024 * 1024)
+				size_str = f'{size_mb:.1f}MB'
+				new_file_name = f"{size_str}_{entry.name}"
+				new_file_path = os.path.join(output, new_file_name)
+				os.rename(entry.path, new_file_path)
@@ -0,0 +1,125 @@
+import functools
+import os
+import shutil
+import subprocess
+import sys
+
+import cv2
+
+SYSTEM_OS = sys.platform
+
+
+class CudaVideoWriter:
+	"""H.264 writer that encodes on the GPU via NVENC (cv2.cudacodec)."""
+
+	def __init__(self, filename, fps, size):
+		w, h = size
+		# BGR is the default colorFormat
+		self.writer = cv2.cudacodec.createVideoWriter(filename, (w, h), cv2.cudacodec.H264, fps)
+		# single device buffer, re-uploaded into every frame
+		self.gpu_frame = cv2.cuda_GpuMat(h, w, cv2.CV_8UC3)
+
+	def write(self, frame):
+		self.gpu_frame.upload(frame)
+		self.writer.write(self.gpu_frame)
+
+	def release(self):
+		self.writer.release()
+
+
+# ffmpeg output options for each H.264 encoder we may pick
+FFMPEG_ENCODERS = {
+	'h264_nvenc':        ['-preset', 'p4', '-b:v', '8M'],
+	'h264_videotoolbox': ['-b:v', '8M'],
+	'libx264':           ['-preset', 'ultrafast', '-threads', str(os.cpu_count() or 1)],
+}
+
+class FFmpegVideoWriter:
+	"""Pipes raw BGR (or I420) frames to an ffmpeg process for H.264 encoding."""
+
+	def __init__(self, filename, fps, size, encoder, pix_fmt='bgr24'):
+		w, h = size
+		# the encoders take yuv420p as-is; bgr24 has to be converted by ffmpeg
+		output_fmt = [] if pix_fmt == 'yuv420p' else ['-pix_fmt', 'yuv420p']
+		if w % 2 or h % 2:
+			# yuv420p needs even dimensions; pad odd window sizes by one pixel
+			output_fmt = ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', *output_fmt]
+		self.proc = subprocess.Popen(
+			[
+				'ffmpeg', '-y', '-loglevel', 'error',
+				'-f', 'rawvideo', '-pix_fmt', pix_fmt,
+				'-s', f'{w}x{h}', '-r', str(fps), '-i', '-',
+				'-c:v', encoder, *FFMPEG_ENCODERS[encoder], *output_fmt,
+				filename
+			],
+			stdin=subprocess.PIPE
+		)
+
+	def write(self, frame):
+		# frame is a contiguous ndarray, so hand ffmpeg its buffer directly
+		self.proc.stdin.write(memoryview(frame))
+
+	def release(self):
+		self.proc.stdin.close()
+		self.proc.wait()
+
+
+def cuda_available():
+	if not hasattr(cv2, 'cudacodec'):
+		return False
+	try:
+		return cv2.cuda.getCudaEnabledDeviceCount() > 0
+	except cv2.error:
+		return False
+
+
+def encoder_works(encoder):
+	"""Encode one synthetic frame with encoder; builds often list NVENC without a usable GPU."""
+	try:
+		result = subprocess.run(
+			[
+				'ffmpeg', '-hide_banner', '-loglevel', 'error',
+				'-f', 'lavfi', '-i', 'nullsrc=s=256x256', '-frames:v', '1',
+				'-c:v', encoder, '-f', 'null', '-'
+			],
+			capture_output=True, timeout=15
+		)
+	except subprocess.TimeoutExpired:
+		return False
+	return result.returncode == 0
+
+
+@functools.cache
+def ffmpeg_encoder():
+	"""Return the preferred working H.264 encoder, or None without a usable ffmpeg."""
+	if not shutil.which('ffmpeg'):
+		return None
+	hardware = 'h264_videotoolbox' if SYSTEM_OS == 'darwin' else 'h264_nvenc'
+	for encoder in (hardware, 'libx264'):
+		if encoder_works(encoder):
+			return encoder
+	return None
+
+
+def open_video_writer(filename, fps, size, pix_fmt='bgr24'):
+	"""
+	Open the fastest available H.264 writer:
+		- ffmpeg pipe using NVENC (win32) / VideoToolbox (darwin), else libx264
+		- NVENC through cv2.cudacodec when ffmpeg is not installed (win32)
+	Falls back to OpenCV's CPU mp4v writer.
+	pix_fmt='yuv420p' is only accepted by the ffmpeg pipe; check ffmpeg_encoder() first.
+	"""
+	encoder = ffmpeg_encoder()
+	if encoder is not None:
+		return FFmpegVideoWriter(filename, fps, size, encoder, pix_fmt)
+	if pix_fmt != 'bgr24':
+		raise ValueError(f"pix_fmt '{pix_fmt}' requires ffmpeg")
+	if SYSTEM_OS == 'win32' and cuda_available():
+		try:
+			return CudaVideoWriter(filename, fps, size)
+		except (cv2.error, AttributeError) as e:
+			# AttributeError: cudacodec bindings differ across OpenCV builds
+			print(f"NVENC writer unavailable ({e}); falling back to mp4v")
+
+	fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+	return cv2.VideoWriter(filename, fourcc, fps, size)
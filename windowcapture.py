@@ -1,6 +1,9 @@
 import numpy as np
 import Quartz as QZ
 
+class WindowNotFound(Exception):
+	pass
+
 class WindowCapture:
 
 	# properties
@@ -17,7 +20,7 @@ class WindowCapture:
 			self.window = self.get_window()
 
 			if self.window is None:
-				raise Exception('Unable to find window: {}'.format(given_window_name))
+				raise WindowNotFound('Unable to find window: {}'.format(given_window_name))
 
 			self.window_id = self.get_window_id()
 